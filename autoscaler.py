@@ -1,27 +1,72 @@
 import os
+import atexit
+import functools
 import json
 import logging
 import logging.handlers
+import queue
+import re
 import requests
+from requests.adapters import HTTPAdapter
 import sys
+import threading
 import time
-from datetime import datetime, timedelta
+import traceback
+import warnings
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
 from pathlib import Path
+from urllib.parse import urlsplit
 import urllib3
+from urllib3.util.retry import Retry
 
-# Disable SSL warnings when verify=False is used
-urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+try:
+    import orjson
+except ImportError:  # orjson is optional, the stdlib encoder works too, just slower
+    orjson = None
+
+if orjson is not None:
+    def dump_json(obj, indent=False):
+        """Serialize obj to compact (or indented) JSON bytes."""
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+
+    load_json = orjson.loads
+else:
+    def _json_default(obj):
+        if isinstance(obj, datetime):
+            return obj.isoformat()
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+    def dump_json(obj, indent=False):
+        """Serialize obj to compact (or indented) JSON bytes."""
+        if indent:
+            return json.dumps(obj, indent=2, ensure_ascii=False, default=_json_default).encode()
+        return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=_json_default).encode()
+
+    load_json = json.loads
 
 DEFAULT_MIN_REPLICAS = 1
 DEFAULT_MAX_REPLICAS = 10
 DEFAULT_UP_THRESHOLD = 70
 DEFAULT_DOWN_THRESHOLD = 30
 COOLDOWN_MINUTES = 5
+MIN_CPU_CHANGE = 5  # CPU must move this many points since the last run to scale
+EXPOSED_PORTS_CACHE_SECONDS = 10 * 60  # Port config only changes on deploy
+REPLICAS_CACHE_SECONDS = 60
+INSPECT_CACHE_SECONDS = 5
 DEFAULT_IGNORE_EXPOSED = True
+DEFAULT_CONCURRENCY = 16
+DEFAULT_SCALE_CONCURRENCY = 4  # Deploys run at the same time, kept low to spare Easypanel
+
+# Stats fields that may hold the CPU usage, in lookup order
+CPU_FIELDS = ("cpu", "cpuUsage", "cpuPercent", "cpuPercentage", "CPU", "cpu_usage", "cpu_percent")
+NESTED_CPU_FIELDS = ("percent", "percentage", "cpu", "cpuUsage", "cpuPercent")
+FRACTION_CPU_FIELDS = frozenset(("percent", "percentage"))  # Values below 1 are fractions
 
 # API Configuration
 DEFAULT_API_BASE_URL = "http://localhost:3000"
 DEFAULT_API_TOKEN = ""
+TRPC_PAYLOAD_PATH = ("result", "data", "json")  # Envelope keys, outermost first
 
 # Logging Configuration
 DEFAULT_LOG_LEVEL = "INFO"
@@ -29,6 +74,19 @@ DEFAULT_LOG_FORMAT = "text"  # "text" or "json"
 DEFAULT_LOG_TO_CONSOLE = True
 DEFAULT_LOG_MAX_SIZE = 10 * 1024 * 1024  # 10MB
 DEFAULT_LOG_BACKUP_COUNT = 5
+LOG_FILE_BUFFER_SIZE = 64 * 1024  # 64KB
+ROLLOVER_CHECK_INTERVAL = 100  # records between log file size checks
+LOG_FLUSH_INTERVAL = 5  # seconds between log file flushes
+DEBUG_PAYLOAD_LIMIT = 1024  # max characters of a raw API response logged at DEBUG
+
+# Numeric levels for log(), resolved once instead of on every call
+LOG_LEVELS = {
+    "DEBUG": logging.DEBUG,
+    "INFO": logging.INFO,
+    "WARNING": logging.WARNING,
+    "ERROR": logging.ERROR,
+    "CRITICAL": logging.CRITICAL,
+}
 
 # Get the directory where the executable is located
 if getattr(sys, 'frozen', False):
@@ -40,16 +98,61 @@ else:
     # Running as script
     APP_DIR = Path(__file__).parent.absolute()
 
-STATE_DIR = os.path.join(APP_DIR, "state/")
+STATE_FILE = os.path.join(APP_DIR, "state.json")
+LEGACY_STATE_DIR = os.path.join(APP_DIR, "state")  # Per-service files from older versions
 CONFIG_PATH = os.path.join(APP_DIR, "services.json")
 LOG_FILE = os.path.join(APP_DIR, "autoscaler.log")
 
-os.makedirs(STATE_DIR, exist_ok=True)
-
 # Global logger instance
 logger = None
 
-class ColoredFormatter(logging.Formatter):
+# Background thread that drains queued log records into the real handlers
+_log_listener = None
+
+# Parsed services.json and the mtime it was read at (see load_config)
+_CONFIG_CACHE = {"mtime": None, "data": None}
+
+# Where the CPU usage was found in the last stats response, as
+# (field, nested_field); see extract_cpu_usage
+_CPU_LOCATION = None
+
+# Recent inspectService responses as (fetched_at, response), keyed by
+# (project_name, service_name); see inspect_service
+_INSPECT_CACHE = {}
+
+# Scaling state for all services, loaded once per run (see load_state)
+_STATE = {"last_scaled": {}, "last_cpu": {}, "api_cache": {}}
+
+# Shared HTTP session so keep-alive connections are reused across API calls
+_SESSION = requests.Session()
+
+# Setting a session header to None removes it for that request
+DEPLOY_HEADERS = {"Authorization": None, "Content-Type": None}
+
+def mount_http_adapters(pool_size):
+    """Size the shared session's connection pool for the expected concurrency."""
+    # Only idempotent requests are retried; urllib3 never retries POST by default.
+    # Read timeouts are not retried (read=0): a hung API would otherwise hold
+    # each call for several full timeouts and stretch a run into the next one.
+    retries = Retry(total=3, read=0, backoff_factor=0.3, status_forcelist=[502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retries)
+    _SESSION.mount("http://", adapter)
+    _SESSION.mount("https://", adapter)
+
+mount_http_adapters(32)
+
+class ServiceFormatter(logging.Formatter):
+    """Text formatter that prefixes the message with the service name, if any."""
+
+    def formatMessage(self, record):
+        # record.message is rebuilt by every Formatter.format() call, so the
+        # prefix never leaks into other handlers
+        service_name = getattr(record, 'service_name', None)
+        if service_name is not None:
+            record.message = f"[{service_name}] {record.message}"
+        return super().formatMessage(record)
+
+class ColoredFormatter(ServiceFormatter):
     """Custom formatter with colors for console output."""
 
     COLORS = {
@@ -61,22 +164,90 @@ class ColoredFormatter(logging.Formatter):
     }
     RESET = '\033[0m'
 
-    def format(self, record):
-        if hasattr(record, 'service_name'):
-            record.msg = f"[{record.service_name}] {record.msg}"
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pfx = {LOG_LEVELS[name]: color for name, color in self.COLORS.items()}
 
+    def format(self, record):
         formatted = super().format(record)
 
-        if record.levelname in self.COLORS:
-            return f"{self.COLORS[record.levelname]}{formatted}{self.RESET}"
+        pfx = self._pfx.get(record.levelno)
+        if pfx:
+            return f"{pfx}{formatted}{self.RESET}"
         return formatted
 
+class BufferedRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """Rotating file handler that flushes its stream buffer on a timer.
+
+    The file size is only checked every ROLLOVER_CHECK_INTERVAL records, so
+    a log file can overshoot maxBytes by a few records before rotating.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._records_until_check = 0
+
+        # Flush on a timer so a crash loses at most a few seconds of logs
+        self._stop_flushing = threading.Event()
+        threading.Thread(target=self._flush_periodically, name="log-flush", daemon=True).start()
+
+    def _flush_periodically(self):
+        while not self._stop_flushing.wait(LOG_FLUSH_INTERVAL):
+            self.flush()
+
+    def close(self):
+        self._stop_flushing.set()
+        super().close()
+
+    def _open(self):
+        # FileHandler only has an errors attribute on Python 3.9+
+        return open(self.baseFilename, self.mode, buffering=LOG_FILE_BUFFER_SIZE,
+                    encoding=self.encoding, errors=getattr(self, "errors", None))
+
+    def shouldRollover(self, record):
+        if self._records_until_check > 0:
+            self._records_until_check -= 1
+            return False
+        self._records_until_check = ROLLOVER_CHECK_INTERVAL - 1
+        return super().shouldRollover(record)
+
+    def emit(self, record):
+        # RotatingFileHandler.emit without StreamHandler's flush after every
+        # record; buffered data is flushed on a timer, on CRITICAL records
+        # and when closed
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(self.format(record) + self.terminator)
+            # Fatal errors are written out right away so they survive a hard exit
+            if record.levelno >= logging.CRITICAL:
+                self.stream.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
 class JSONFormatter(logging.Formatter):
     """Custom formatter for JSON output."""
 
+    # Service-specific record attributes copied into the entry when present
+    _EXTRA_FIELDS = (
+        'service_name',
+        'project_name',
+        'cpu_usage',
+        'replicas',
+        'action',
+        'api_endpoint',
+        'response_time',
+    )
+    _MISSING = object()
+
     def format(self, record):
         log_entry = {
-            'timestamp': datetime.fromtimestamp(record.created).isoformat(),
+            # dump_json serializes datetime itself, no isoformat() round-trip needed
+            'timestamp': datetime.fromtimestamp(record.created),
             'level': record.levelname,
             'message': record.getMessage(),
             'module': record.module,
@@ -84,29 +255,28 @@ class JSONFormatter(logging.Formatter):
             'line': record.lineno
         }
 
-        # Add service-specific fields if available
-        if hasattr(record, 'service_name'):
-            log_entry['service_name'] = record.service_name
-        if hasattr(record, 'project_name'):
-            log_entry['project_name'] = record.project_name
-        if hasattr(record, 'cpu_usage'):
-            log_entry['cpu_usage'] = record.cpu_usage
-        if hasattr(record, 'replicas'):
-            log_entry['replicas'] = record.replicas
-        if hasattr(record, 'action'):
-            log_entry['action'] = record.action
-        if hasattr(record, 'api_endpoint'):
-            log_entry['api_endpoint'] = record.api_endpoint
-        if hasattr(record, 'response_time'):
-            log_entry['response_time'] = record.response_time
-
-        return json.dumps(log_entry)
-
-def setup_logging():
-    """Setup comprehensive logging configuration."""
-    global logger
+        # Add service-specific fields if available. Extras always land in the
+        # record's __dict__, so a plain dict lookup skips getattr's class and
+        # descriptor search.
+        missing = self._MISSING
+        record_fields = record.__dict__
+        for field in self._EXTRA_FIELDS:
+            value = record_fields.get(field, missing)
+            if value is not missing:
+                log_entry[field] = value
 
-    config = load_config()
+        return dump_json(log_entry).decode()
+
+def setup_logging(config=None):
+    """Setup comprehensive logging configuration.
+
+    Records are handed to a queue and written by a background listener, so
+    callers never block on console or file I/O.
+    """
+    global logger, _log_listener
+
+    if config is None:
+        config = load_config()
     log_config = config.get("logging", {})
 
     # Get logging configuration
@@ -122,9 +292,14 @@ def setup_logging():
 
     # Clear any existing handlers
     logger.handlers.clear()
+    if _log_listener is not None:
+        _log_listener.stop()
+        for handler in _log_listener.handlers:
+            handler.close()
+    handlers = []
 
     # File handler with rotation
-    file_handler = logging.handlers.RotatingFileHandler(
+    file_handler = BufferedRotatingFileHandler(
         LOG_FILE,
         maxBytes=max_size,
         backupCount=backup_count,
@@ -144,42 +319,97 @@ def setup_logging():
             )
             console_handler.setFormatter(console_formatter)
 
-        logger.addHandler(console_handler)
+        handlers.append(console_handler)
 
     # Set file formatter
     if log_format == "json":
         file_handler.setFormatter(JSONFormatter())
     else:
-        file_formatter = logging.Formatter(
+        file_formatter = ServiceFormatter(
             '%(asctime)s - %(levelname)s - %(message)s',
             datefmt='%Y-%m-%d %H:%M:%S'
         )
         file_handler.setFormatter(file_formatter)
 
-    logger.addHandler(file_handler)
+    handlers.append(file_handler)
+
+    log_queue = queue.Queue(-1)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    _log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
 
     return logger
 
-def log(message, level="INFO", **kwargs):
-    """Enhanced logging function with support for structured logging."""
+@atexit.register
+def stop_logging():
+    """Flush queued log records and stop the background listener."""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+def log(message, *args, level="INFO", **kwargs):
+    """Enhanced logging function with support for structured logging.
+
+    message is a %-style template; args are only interpolated if the record
+    is actually emitted. level may be a level name from LOG_LEVELS or a
+    numeric logging level.
+    """
     if logger is None:
         setup_logging()
 
-    log_level = getattr(logging, level.upper(), logging.INFO)
+    log_level = level if isinstance(level, int) else LOG_LEVELS.get(level, logging.INFO)
 
-    # Create a LogRecord with extra fields
-    extra = {}
-    for key, value in kwargs.items():
-        extra[key] = value
+    # Drop filtered records before building the extra fields
+    if not logger.isEnabledFor(log_level):
+        return
 
-    logger.log(log_level, message, extra=extra)
+    # kwargs is already a fresh dict, so it can serve as the extra fields as-is.
+    # stacklevel=2 attributes the record to our caller instead of log() itself.
+    logger.log(log_level, message, *args, extra=kwargs or None, stacklevel=2)
+
+def is_debug_enabled():
+    """Check whether DEBUG records would be emitted, before building them."""
+    if logger is None:
+        setup_logging()
+    return logger.isEnabledFor(logging.DEBUG)
+
+def format_payload(response):
+    """Pretty-print an API response for DEBUG logs, truncated to DEBUG_PAYLOAD_LIMIT"""
+    text = dump_json(response, indent=True).decode()
+    if len(text) > DEBUG_PAYLOAD_LIMIT:
+        return f"{text[:DEBUG_PAYLOAD_LIMIT]}... ({len(text)} chars total)"
+    return text
 
 def load_config():
-    if os.path.exists(CONFIG_PATH):
-        with open(CONFIG_PATH) as f:
-            return json.load(f)
-    return {}
+    """Load services.json, re-parsing it only when the file has changed."""
+    try:
+        mtime = os.stat(CONFIG_PATH).st_mtime
+    except FileNotFoundError:
+        mtime = None
+
+    if _CONFIG_CACHE["data"] is None or mtime != _CONFIG_CACHE["mtime"]:
+        if mtime is None:
+            data = {}
+        else:
+            with open(CONFIG_PATH) as f:
+                data = json.load(f)
+        _CONFIG_CACHE["data"] = data
+        _CONFIG_CACHE["mtime"] = mtime
 
+        # Everything derived from the API settings has to be rebuilt
+        get_api_config.cache_clear()
+        get_api_session.cache_clear()
+        get_api_sender.cache_clear()
+
+    return _CONFIG_CACHE["data"]
+
+def reload_config():
+    """Discard the cached configuration and re-read services.json."""
+    _CONFIG_CACHE["data"] = None
+    return load_config()
+
+@functools.lru_cache(maxsize=1)
 def get_api_config():
     """Get API configuration from config file or environment variables."""
     config = load_config()
@@ -194,63 +424,144 @@ def get_api_config():
 
     return base_url.rstrip('/'), token, verify_ssl
 
-def make_api_request(endpoint, params=None, method="GET", data=None):
-    """Make a request to the Easypanel API with detailed logging."""
+@functools.lru_cache(maxsize=1)
+def get_api_session():
+    """Get the shared API session, setting auth headers on first use."""
     base_url, token, verify_ssl = get_api_config()
-    url = f"{base_url}{endpoint}"
-
-    headers = {
+    _SESSION.headers.update({
         "Authorization": f"Bearer {token}",
         "Content-Type": "application/json"
-    }
+    })
+    _SESSION.verify = verify_ssl
+    if not verify_ssl:
+        # Only silence certificate warnings when verification is actually off,
+        # and only for the API host: urllib3.disable_warnings() would hide
+        # them for every HTTPS request in the process
+        host = urlsplit(base_url).hostname or ""
+        warnings.filterwarnings("ignore", message=f"Unverified HTTPS request is being made to host '{re.escape(host)}'",
+                                category=urllib3.exceptions.InsecureRequestWarning)
+    return _SESSION
+
+@functools.lru_cache(maxsize=None)
+def get_api_sender(endpoint, method):
+    """Bind the session call, full URL and timeout for one endpoint and method."""
+    base_url, _, _ = get_api_config()
+    session = get_api_session()
+
+    if method == "GET":
+        send = session.get
+    elif method == "POST":
+        send = session.post
+    else:
+        raise ValueError(f"Unsupported HTTP method: {method}")
+
+    return functools.partial(send, f"{base_url}{endpoint}", timeout=30)
+
+def make_api_request(endpoint, params=None, method="GET", data=None):
+    """Make a request to the Easypanel API with detailed logging."""
+    send = get_api_sender(endpoint, method)
+
+    debug_enabled = is_debug_enabled()
 
     # Log the request
-    log(f"Making {method} request to {endpoint}",
-        level="DEBUG",
-        api_endpoint=endpoint,
-        method=method,
-        params=params if params else None,
-        data=data if data else None)
+    if debug_enabled:
+        log("Making %s request to %s", method, endpoint,
+            level=logging.DEBUG,
+            api_endpoint=endpoint,
+            method=method,
+            params=params if params else None,
+            data=data if data else None)
 
     start_time = time.time()
 
     try:
-        if method == "GET":
-            response = requests.get(url, headers=headers, params=params, timeout=30, verify=verify_ssl)
-        elif method == "POST":
-            response = requests.post(url, headers=headers, json=data, timeout=30, verify=verify_ssl)
+        if data is None:
+            response = send(params=params)
         else:
-            raise ValueError(f"Unsupported HTTP method: {method}")
+            response = send(data=dump_json(data))
 
         response_time = round((time.time() - start_time) * 1000, 2)  # ms
 
+        # Check the status directly rather than raising and catching HTTPError
+        if not response.ok:
+            log("API request failed with HTTP error: %s %s", response.status_code, response.reason,
+                level="ERROR",
+                api_endpoint=endpoint,
+                status_code=response.status_code,
+                response_time=response_time)
+            return None
+
         # Log successful response
-        log(f"API request successful",
-            level="DEBUG",
-            api_endpoint=endpoint,
-            status_code=response.status_code,
-            response_time=response_time)
+        if debug_enabled:
+            log("API request successful",
+                level=logging.DEBUG,
+                api_endpoint=endpoint,
+                status_code=response.status_code,
+                response_time=response_time)
 
-        response.raise_for_status()
-        return response.json()
+        # Decode the raw bytes, which skips requests' text encoding detection
+        return load_json(response.content)
 
-    except requests.exceptions.HTTPError as e:
+    except requests.exceptions.RequestException as e:
         response_time = round((time.time() - start_time) * 1000, 2)
-        log(f"API request failed with HTTP error: {e}",
+        log("API request failed: %s", e,
             level="ERROR",
             api_endpoint=endpoint,
-            status_code=response.status_code if 'response' in locals() else None,
             response_time=response_time)
         return None
 
-    except requests.exceptions.RequestException as e:
+    # JSONDecodeError (orjson's included) and the UnicodeDecodeError json.loads
+    # raises on a non-UTF-8 body are both ValueErrors. Handled after
+    # RequestException, whose InvalidURL and friends are ValueErrors too.
+    except ValueError as e:
         response_time = round((time.time() - start_time) * 1000, 2)
-        log(f"API request failed: {e}",
+        log("API returned invalid JSON: %s", e,
             level="ERROR",
             api_endpoint=endpoint,
             response_time=response_time)
         return None
 
+def batch_api_request(calls):
+    """Send several tRPC queries in one round-trip using tRPC's batch format.
+
+    calls is a list of (endpoint, params) pairs as passed to
+    make_api_request. Returns one response per call, with None for calls
+    that failed or when the batch request itself failed.
+    """
+    procedures = ",".join(endpoint.rsplit("/", 1)[-1] for endpoint, _ in calls)
+    inputs = ",".join(f'"{i}":{params["input"]}' for i, (_, params) in enumerate(calls))
+
+    response = make_api_request(f"/api/trpc/{procedures}", params={"batch": "1", "input": f"{{{inputs}}}"})
+    if not isinstance(response, list) or len(response) != len(calls):
+        return [None] * len(calls)
+    return [item if isinstance(item, dict) and "result" in item else None for item in response]
+
+def unwrap_trpc(response):
+    """Return the payload of a tRPC response.
+
+    Descends result -> data -> json as far as the response goes, so the
+    standard envelope, a bare data object and a direct payload all work.
+    """
+    result = response
+    for key in TRPC_PAYLOAD_PATH:
+        if isinstance(result, dict) and key in result:
+            result = result[key]
+    return result
+
+@functools.lru_cache(maxsize=256)
+def service_input(project_name, service_name):
+    """Serialize the tRPC input for a service once; dump_json output is already compact."""
+    return dump_json({
+        "json": {
+            "projectName": project_name,
+            "serviceName": service_name
+        }
+    }).decode()
+
+def build_service_params(project_name, service_name):
+    """Build the tRPC query parameters that identify a single service."""
+    return {"input": service_input(project_name, service_name)}
+
 def get_projects_and_services():
     """Get all projects and their services from Easypanel API."""
     log("Fetching projects and services from API", level="DEBUG")
@@ -263,42 +574,34 @@ def get_projects_and_services():
     services = []
     try:
         # Log the raw response for debugging
-        log(f"Raw API response structure: {type(response)}", level="DEBUG")
+        log("Raw API response structure: %s", type(response), level="DEBUG")
 
         # Navigate to the actual data
-        data = None
-        if isinstance(response, dict):
-            if "result" in response:
-                result_data = response["result"]
-                if isinstance(result_data, dict) and "data" in result_data:
-                    data_section = result_data["data"]
-                    if isinstance(data_section, dict) and "json" in data_section:
-                        data = data_section["json"]
-
-        if data is None:
+        data = unwrap_trpc(response)
+        if not isinstance(data, dict):
             log("Could not find data in API response", level="ERROR")
             return []
 
-        log(f"Data structure: {type(data)}, keys: {list(data.keys()) if isinstance(data, dict) else 'N/A'}", level="DEBUG")
+        log("Data structure: %s, keys: %s", type(data), list(data.keys()) if isinstance(data, dict) else 'N/A', level="DEBUG")
 
         # Extract projects and services from the new format
         projects_data = data.get("projects", [])
         services_data = data.get("services", [])
 
-        log(f"Found {len(projects_data)} projects and {len(services_data)} services in API response", level="DEBUG")
+        log("Found %s projects and %s services in API response", len(projects_data), len(services_data), level="DEBUG")
 
         # Create a mapping of project names for validation
-        project_names = set()
-        for project in projects_data:
-            if isinstance(project, dict) and "name" in project:
-                project_names.add(project["name"])
+        project_names = {
+            project["name"] for project in projects_data
+            if isinstance(project, dict) and "name" in project
+        }
 
-        log(f"Available projects: {list(project_names)}", level="DEBUG")
+        log("Available projects: %s", list(project_names), level="DEBUG")
 
         # Process services
         for service in services_data:
             if not isinstance(service, dict):
-                log(f"Expected service to be a dict, got {type(service)}: {service}", level="WARNING")
+                log("Expected service to be a dict, got %s: %s", type(service), service, level="WARNING")
                 continue
 
             project_name = service.get("projectName", "")
@@ -306,21 +609,21 @@ def get_projects_and_services():
             service_type = service.get("type", "")
 
             if not project_name:
-                log(f"Service missing projectName field: {service}", level="WARNING")
+                log("Service missing projectName field: %s", service, level="WARNING")
                 continue
 
             if not service_name:
-                log(f"Service missing name field: {service}", level="WARNING")
+                log("Service missing name field: %s", service, level="WARNING")
                 continue
 
             # Only include app services (skip databases, etc.)
-            if service_type not in ["app"]:
-                log(f"Skipping service {project_name}/{service_name} of type '{service_type}'", level="DEBUG")
+            if service_type != "app":
+                log("Skipping service %s/%s of type '%s'", project_name, service_name, service_type, level="DEBUG")
                 continue
 
             # Verify project exists
             if project_name not in project_names:
-                log(f"Service {service_name} references unknown project {project_name}", level="WARNING")
+                log("Service %s references unknown project %s", service_name, project_name, level="WARNING")
                 continue
 
             services.append({
@@ -330,129 +633,106 @@ def get_projects_and_services():
                 "type": service_type
             })
 
-        log(f"Found {len(services)} app services across {len(project_names)} projects",
+        log("Found %s app services across %s projects", len(services), len(project_names),
             level="INFO")
 
         # Log service details at debug level
-        for service in services:
-            log(f"Discovered service: {service['full_name']} (type: {service['type']})",
-                level="DEBUG",
-                project_name=service['project'],
-                service_name=service['service'])
+        if is_debug_enabled():
+            for service in services:
+                log("Discovered service: %s (type: %s)", service['full_name'], service['type'],
+                    level="DEBUG",
+                    project_name=service['project'],
+                    service_name=service['service'])
 
     except Exception as e:
-        log(f"Error parsing projects and services: {e}",
+        log("Error parsing projects and services: %s", e,
             level="ERROR")
         # Log the full traceback for debugging
-        import traceback
-        log(f"Full traceback: {traceback.format_exc()}", level="DEBUG")
+        if is_debug_enabled():
+            log("Full traceback: %s", traceback.format_exc(), level="DEBUG")
 
     return services
 
-def get_service_stats(project_name, service_name):
+def get_service_stats(project_name, service_name, params=None):
     """Get CPU stats for a specific service."""
-    params = {
-        "input": json.dumps({
-            "json": {
-                "projectName": project_name,
-                "serviceName": service_name
-            }
-        })
-    }
+    if params is None:
+        params = build_service_params(project_name, service_name)
 
     response = make_api_request("/api/trpc/monitor.getServiceStats", params=params)
+    return parse_service_stats(response, project_name, service_name)
+
+def parse_service_stats(response, project_name, service_name):
+    """Extract the stats dict from a getServiceStats response."""
     if not response:
         return None
 
-    try:
-        # Log the raw response for debugging
-        log(f"Service stats raw response: {json.dumps(response, indent=2)}", level="DEBUG")
-
-        # Handle different possible response structures
-        result = None
-
-        if isinstance(response, dict):
-            # Standard tRPC response format
-            if "result" in response:
-                result_data = response["result"]
-                if isinstance(result_data, dict) and "data" in result_data:
-                    data = result_data["data"]
-                    if isinstance(data, dict) and "json" in data:
-                        result = data["json"]
-                    elif isinstance(data, dict):
-                        result = data
-                elif isinstance(result_data, dict):
-                    result = result_data
-            # Direct data format
-            elif "data" in response:
-                data = response["data"]
-                if isinstance(data, dict) and "json" in data:
-                    result = data["json"]
-                elif isinstance(data, dict):
-                    result = data
-            # Direct stats format
-            else:
-                result = response
-
-        if result is None or not isinstance(result, dict):
-            log(f"Invalid service stats response format for {project_name}/{service_name}", level="WARNING")
-            return None
+    # Log the raw response for debugging
+    if is_debug_enabled():
+        log("Service stats raw response: %s", format_payload(response), level="DEBUG")
 
-        return result
+    result = unwrap_trpc(response)
 
-    except Exception as e:
-        log(f"Error parsing service stats for {project_name}/{service_name}: {e}", level="ERROR")
-        import traceback
-        log(f"Full traceback: {traceback.format_exc()}", level="DEBUG")
+    if not isinstance(result, dict):
+        log("Invalid service stats response format for %s/%s", project_name, service_name, level="WARNING")
         return None
 
-def get_replicas(project_name, service_name):
-    """Get current replica count for a service."""
-    params = {
-        "input": json.dumps({
-            "json": {
-                "projectName": project_name,
-                "serviceName": service_name
-            }
-        })
-    }
+    return result
+
+def inspect_service(project_name, service_name, params=None):
+    """Inspect a service, reusing a response fetched in the last few seconds.
+
+    get_replicas and get_deployment_url both read the inspectService
+    payload, so a scale right after the replica check costs no extra call.
+    """
+    key = (project_name, service_name)
+    cached = _INSPECT_CACHE.get(key)
+    if cached is not None and time.time() - cached[0] < INSPECT_CACHE_SECONDS:
+        return cached[1]
+
+    if params is None:
+        params = build_service_params(project_name, service_name)
 
     response = make_api_request("/api/trpc/services.app.inspectService", params=params)
+    if response:
+        _INSPECT_CACHE[key] = (time.time(), response)
+    return response
+
+def get_stats_and_inspect(project_name, service_name, params=None):
+    """Fetch service stats and the inspect payload in one batched request.
+
+    The inspect response seeds the inspect cache, so the replica lookup
+    that follows needs no request of its own. Falls back to a plain stats
+    request when the batch fails.
+    """
+    if params is None:
+        params = build_service_params(project_name, service_name)
+
+    stats_response, inspect_response = batch_api_request([
+        ("/api/trpc/monitor.getServiceStats", params),
+        ("/api/trpc/services.app.inspectService", params),
+    ])
+    if inspect_response is not None:
+        _INSPECT_CACHE[(project_name, service_name)] = (time.time(), inspect_response)
+
+    if stats_response is None:
+        return get_service_stats(project_name, service_name, params)
+    return parse_service_stats(stats_response, project_name, service_name)
+
+def get_replicas(project_name, service_name, params=None):
+    """Get current replica count for a service."""
+    response = inspect_service(project_name, service_name, params)
     if not response:
         return 0
 
     try:
         # Log the raw response for debugging
-        log(f"Service inspect raw response: {json.dumps(response, indent=2)}", level="DEBUG")
-
-        # Handle different possible response structures
-        result = None
-
-        if isinstance(response, dict):
-            # Standard tRPC response format
-            if "result" in response:
-                result_data = response["result"]
-                if isinstance(result_data, dict) and "data" in result_data:
-                    data = result_data["data"]
-                    if isinstance(data, dict) and "json" in data:
-                        result = data["json"]
-                    elif isinstance(data, dict):
-                        result = data
-                elif isinstance(result_data, dict):
-                    result = result_data
-            # Direct data format
-            elif "data" in response:
-                data = response["data"]
-                if isinstance(data, dict) and "json" in data:
-                    result = data["json"]
-                elif isinstance(data, dict):
-                    result = data
-            # Direct service format
-            else:
-                result = response
-
-        if result is None or not isinstance(result, dict):
-            log(f"Invalid service inspect response format for {project_name}/{service_name}", level="WARNING")
+        if is_debug_enabled():
+            log("Service inspect raw response: %s", format_payload(response), level="DEBUG")
+
+        result = unwrap_trpc(response)
+
+        if not isinstance(result, dict):
+            log("Invalid service inspect response format for %s/%s", project_name, service_name, level="WARNING")
             return 0
 
         # Try to find replicas in different possible locations
@@ -476,161 +756,113 @@ def get_replicas(project_name, service_name):
         try:
             replicas = int(replicas)
         except (ValueError, TypeError):
-            log(f"Invalid replicas value for {project_name}/{service_name}: {replicas}", level="WARNING")
+            log("Invalid replicas value for %s/%s: %s", project_name, service_name, replicas, level="WARNING")
             replicas = 0
 
         return replicas
 
     except Exception as e:
-        log(f"Error getting replicas for {project_name}/{service_name}: {e}", level="ERROR")
-        import traceback
-        log(f"Full traceback: {traceback.format_exc()}", level="DEBUG")
+        log("Error getting replicas for %s/%s: %s", project_name, service_name, e, level="ERROR")
+        if is_debug_enabled():
+            log("Full traceback: %s", traceback.format_exc(), level="DEBUG")
         return 0
 
-def has_exposed_ports(project_name, service_name):
-    """Check if the service has any published ports."""
-    params = {
-        "input": json.dumps({
-            "json": {
-                "projectName": project_name,
-                "serviceName": service_name
-            }
-        })
-    }
+def has_exposed_ports(project_name, service_name, params=None):
+    """Check if the service has any published ports.
+
+    Returns None when the ports could not be determined; callers treat that
+    like False so API errors never block autoscaling.
+    """
+    if params is None:
+        params = build_service_params(project_name, service_name)
 
     response = make_api_request("/api/trpc/services.app.getExposedPorts", params=params)
     if not response:
-        # Default to False to avoid blocking autoscaling due to API errors
-        log(f"No response from exposed ports API for {project_name}/{service_name}", level="DEBUG")
-        return False
+        log("No response from exposed ports API for %s/%s", project_name, service_name, level="DEBUG")
+        return None
 
     try:
         # Log the raw response for debugging
-        log(f"Exposed ports raw response: {json.dumps(response, indent=2)}", level="DEBUG")
-
-        # Handle different possible response structures
-        result = None
-
-        if isinstance(response, dict):
-            # Standard tRPC response format
-            if "result" in response:
-                result_data = response["result"]
-                if isinstance(result_data, dict) and "data" in result_data:
-                    data = result_data["data"]
-                    if isinstance(data, dict) and "json" in data:
-                        result = data["json"]
-                    elif isinstance(data, list):
-                        result = data
-                elif isinstance(result_data, list):
-                    result = result_data
-            # Direct data format
-            elif "data" in response:
-                data = response["data"]
-                if isinstance(data, dict) and "json" in data:
-                    result = data["json"]
-                elif isinstance(data, list):
-                    result = data
-            # Direct ports format
-            elif isinstance(response, list):
-                result = response
-        elif isinstance(response, list):
-            result = response
-
-        if result is None:
-            log(f"Could not find ports data for {project_name}/{service_name}", level="DEBUG")
-            return False
+        if is_debug_enabled():
+            log("Exposed ports raw response: %s", format_payload(response), level="DEBUG")
+
+        result = unwrap_trpc(response)
 
         if not isinstance(result, list):
-            log(f"Expected ports data to be a list for {project_name}/{service_name}, got {type(result)}", level="WARNING")
-            return False
+            log("Expected ports data to be a list for %s/%s, got %s", project_name, service_name, type(result), level="WARNING")
+            return None
 
         has_ports = len(result) > 0
-        log(f"Service {project_name}/{service_name} has {len(result)} exposed ports", level="DEBUG")
+        log("Service %s/%s has %s exposed ports", project_name, service_name, len(result), level="DEBUG")
         return has_ports
 
     except Exception as e:
-        log(f"Error checking exposed ports for {project_name}/{service_name}: {e}", level="ERROR")
-        import traceback
-        log(f"Full traceback: {traceback.format_exc()}", level="DEBUG")
-        # Default to False to avoid blocking autoscaling due to inspection errors
-        return False
+        log("Error checking exposed ports for %s/%s: %s", project_name, service_name, e, level="ERROR")
+        if is_debug_enabled():
+            log("Full traceback: %s", traceback.format_exc(), level="DEBUG")
+        return None
 
-def get_deployment_url(project_name, service_name):
+def get_deployment_url(project_name, service_name, params=None):
     """Get the deployment URL for a service."""
-    params = {
-        "input": json.dumps({
-            "json": {
-                "projectName": project_name,
-                "serviceName": service_name
-            }
-        })
-    }
-
-    response = make_api_request("/api/trpc/services.app.inspectService", params=params)
+    response = inspect_service(project_name, service_name, params)
     if not response:
         return None
 
     try:
         # Navigate to the service data
-        result = None
-        if isinstance(response, dict):
-            if "result" in response:
-                result_data = response["result"]
-                if isinstance(result_data, dict) and "data" in result_data:
-                    data = result_data["data"]
-                    if isinstance(data, dict) and "json" in data:
-                        result = data["json"]
+        result = unwrap_trpc(response)
 
         if result and isinstance(result, dict):
             deployment_url = result.get("deploymentUrl")
             if deployment_url:
-                log(f"Found deployment URL for {project_name}/{service_name}: {deployment_url}",
+                log("Found deployment URL for %s/%s: %s", project_name, service_name, deployment_url,
                     level="DEBUG",
                     service_name=f"{project_name}_{service_name}")
                 return deployment_url
 
-        log(f"No deployment URL found for {project_name}/{service_name}",
+        log("No deployment URL found for %s/%s", project_name, service_name,
             level="WARNING",
             service_name=f"{project_name}_{service_name}")
         return None
 
     except Exception as e:
-        log(f"Error getting deployment URL for {project_name}/{service_name}: {e}",
+        log("Error getting deployment URL for %s/%s: %s", project_name, service_name, e,
             level="ERROR")
         return None
 
 def trigger_deployment(deployment_url, project_name, service_name, full_name):
     """Trigger deployment by calling the deployment URL."""
     if not deployment_url:
-        log(f"No deployment URL available for {full_name}",
+        log("No deployment URL available for %s", full_name,
             level="WARNING",
             service_name=full_name,
             action="deploy_skipped")
         return False
 
-    log(f"Triggering deployment for {full_name}",
+    log("Triggering deployment for %s", full_name,
         level="INFO",
         service_name=full_name,
         action="deploy_trigger",
         deployment_url=deployment_url)
 
     try:
-        # Get SSL verification setting from config
-        _, _, verify_ssl = get_api_config()
+        # The shared session carries the SSL verification setting from config
+        session = get_api_session()
 
         # The deployment URL is typically a direct HTTP endpoint
-        # We need to make a POST request to it
-        response = requests.post(deployment_url, timeout=60, verify=verify_ssl)
+        # We need to make a POST request to it. It authenticates through its
+        # own token, so the API headers are dropped rather than leaked to it.
+        response = session.post(deployment_url, timeout=60, headers=DEPLOY_HEADERS)
 
         if response.status_code in [200, 201, 202]:
-            log(f"Successfully triggered deployment for {full_name}",
+            log("Successfully triggered deployment for %s", full_name,
                 level="INFO",
                 service_name=full_name,
                 action="deploy_success",
                 status_code=response.status_code)
             return True
         else:
-            log(f"Failed to trigger deployment for {full_name} - HTTP {response.status_code}",
+            log("Failed to trigger deployment for %s - HTTP %s", full_name, response.status_code,
                 level="ERROR",
                 service_name=full_name,
                 action="deploy_failed",
@@ -639,7 +871,7 @@ def trigger_deployment(deployment_url, project_name, service_name, full_name):
             return False
 
     except requests.exceptions.RequestException as e:
-        log(f"Error triggering deployment for {full_name}: {e}",
+        log("Error triggering deployment for %s: %s", full_name, e,
             level="ERROR",
             service_name=full_name,
             action="deploy_error",
@@ -648,7 +880,7 @@ def trigger_deployment(deployment_url, project_name, service_name, full_name):
 
 def scale_service(project_name, service_name, replicas, full_name):
     """Scale a service to the specified number of replicas and trigger deployment."""
-    log(f"Attempting to scale service to {replicas} replicas",
+    log("Attempting to scale service to %s replicas", replicas,
         level="INFO",
         service_name=full_name,
         project_name=project_name,
@@ -668,7 +900,7 @@ def scale_service(project_name, service_name, replicas, full_name):
 
     response = make_api_request("/api/trpc/services.app.updateDeploy", method="POST", data=data)
     if not response:
-        log(f"Failed to update deployment config for {full_name}",
+        log("Failed to update deployment config for %s", full_name,
             level="ERROR",
             service_name=full_name,
             project_name=project_name,
@@ -676,12 +908,15 @@ def scale_service(project_name, service_name, replicas, full_name):
             target_replicas=replicas)
         return False
 
-    log(f"Successfully updated deployment config for {full_name}",
+    log("Successfully updated deployment config for %s", full_name,
         level="INFO",
         service_name=full_name,
         action="scale_config_success",
         replicas=replicas)
 
+    # Keep the cached replica count in step with the new config
+    store_cached_value(full_name, "replicas", replicas)
+
     # Step 2: Get the deployment URL
     deployment_url = get_deployment_url(project_name, service_name)
 
@@ -690,7 +925,7 @@ def scale_service(project_name, service_name, replicas, full_name):
 
     if deployment_success:
         mark_scaled(full_name)
-        log(f"Successfully scaled and deployed {full_name} to {replicas} replicas",
+        log("Successfully scaled and deployed %s to %s replicas", full_name, replicas,
             level="INFO",
             service_name=full_name,
             project_name=project_name,
@@ -698,7 +933,7 @@ def scale_service(project_name, service_name, replicas, full_name):
             replicas=replicas)
         return True
     else:
-        log(f"Deployment config updated but deployment trigger failed for {full_name}",
+        log("Deployment config updated but deployment trigger failed for %s", full_name,
             level="WARNING",
             service_name=full_name,
             project_name=project_name,
@@ -708,253 +943,463 @@ def scale_service(project_name, service_name, replicas, full_name):
         mark_scaled(full_name)
         return True  # Return True since the scaling config was updated
 
-def is_in_cooldown(service):
-    path = os.path.join(STATE_DIR, f"{service}.last")
-    if not os.path.exists(path):
+def load_state():
+    """Load the consolidated state file into memory."""
+    global _STATE
+    state = {"last_scaled": {}, "last_cpu": {}, "api_cache": {}}
+    # Open directly instead of probing with os.path.exists first
+    try:
+        with open(STATE_FILE, "rb") as f:
+            loaded = load_json(f.read())
+        if not isinstance(loaded, dict):
+            raise TypeError(f"expected a JSON object, got {type(loaded).__name__}")
+        # Every section is used as a dict later on, from the worker threads
+        for section in state:
+            value = loaded.get(section, {})
+            if not isinstance(value, dict):
+                raise TypeError(f"expected {section} to be a JSON object, got {type(value).__name__}")
+        state.update(loaded)
+    except FileNotFoundError:
+        if os.path.isdir(LEGACY_STATE_DIR):
+            migrate_legacy_state(state)
+    except (ValueError, TypeError) as e:
+        # A truncated or corrupt file must not block every future run; keep
+        # it for inspection and start over with empty state
+        corrupt_path = f"{STATE_FILE}.corrupt"
+        os.replace(STATE_FILE, corrupt_path)
+        log("Invalid state file, moved it to %s and starting with empty state: %s", corrupt_path, e,
+            level="WARNING")
+    _STATE = state
+    return _STATE
+
+def migrate_legacy_state(state):
+    """Import the per-service .last/.cpu files written by older versions.
+
+    Only runs while state.json does not exist yet; the first save_state()
+    then makes the consolidated file authoritative.
+    """
+    for entry in os.scandir(LEGACY_STATE_DIR):
+        service, ext = os.path.splitext(entry.name)
+        try:
+            with open(entry.path) as f:
+                value = f.read().strip()
+            if ext == ".last":
+                state["last_scaled"][service] = datetime.fromisoformat(value).timestamp()
+            elif ext == ".cpu":
+                state["last_cpu"][service] = float(value)
+        except (OSError, ValueError) as e:
+            log("Skipping legacy state file %s: %s", entry.name, e, level="WARNING")
+    log("Migrated legacy state from %s", LEGACY_STATE_DIR, level="INFO")
+
+def save_state():
+    """Write the in-memory state back to disk atomically."""
+    tmp_path = f"{STATE_FILE}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(dump_json(_STATE))
+    os.replace(tmp_path, STATE_FILE)
+
+def is_in_cooldown(service, cutoff=None):
+    """Check whether the service was scaled after ``cutoff`` (epoch seconds).
+
+    main() computes the cutoff once per run; without one it is derived from
+    the current time.
+    """
+    last_scaled = _STATE["last_scaled"].get(service)
+    if last_scaled is None:
         return False
-    with open(path) as f:
-        last_time = datetime.fromisoformat(f.read().strip())
-    return datetime.now() - last_time < timedelta(minutes=COOLDOWN_MINUTES)
+    if cutoff is None:
+        cutoff = time.time() - COOLDOWN_MINUTES * 60
+    return last_scaled > cutoff
 
 def mark_scaled(service):
-    with open(os.path.join(STATE_DIR, f"{service}.last"), "w") as f:
-        f.write(datetime.now().isoformat())
+    _STATE["last_scaled"][service] = time.time()
 
 def get_previous_avg(service):
-    path = os.path.join(STATE_DIR, f"{service}.cpu")
-    if os.path.exists(path):
-        with open(path) as f:
-            return float(f.read().strip())
-    return None
+    return _STATE["last_cpu"].get(service)
 
 def save_avg_cpu(service, avg_cpu):
-    with open(os.path.join(STATE_DIR, f"{service}.cpu"), "w") as f:
-        f.write(str(avg_cpu))
+    _STATE["last_cpu"][service] = avg_cpu
+
+def store_cached_value(service, key, value):
+    entry = _STATE["api_cache"].setdefault(service, {})
+    entry[key] = value
+    entry[f"{key}_ts"] = time.time()
+
+def is_cache_fresh(service, key, ttl):
+    entry = _STATE["api_cache"].get(service, {})
+    return key in entry and time.time() - entry.get(f"{key}_ts", 0) < ttl
+
+def get_cached_value(service, key, ttl, fetch):
+    """Return a cached API value for a service, calling fetch() once it is older than ttl seconds.
+
+    A None result from fetch() is returned but not cached.
+    """
+    if is_cache_fresh(service, key, ttl):
+        return _STATE["api_cache"][service][key]
+
+    value = fetch()
+    if value is not None:
+        store_cached_value(service, key, value)
+    return value
+
+def has_exposed_ports_cached(project_name, service_name, full_name, params=None, ttl=EXPOSED_PORTS_CACHE_SECONDS):
+    return get_cached_value(full_name, "exposed", ttl,
+                            lambda: has_exposed_ports(project_name, service_name, params))
+
+def get_replicas_cached(project_name, service_name, full_name, params=None):
+    # get_replicas() reports errors as 0, so only cache real counts
+    replicas = get_cached_value(full_name, "replicas", REPLICAS_CACHE_SECONDS,
+                                lambda: get_replicas(project_name, service_name, params) or None)
+    return replicas or 0
+
+def parse_cpu_value(value):
+    """Convert a CPU reading such as 42.5, "42.5" or "42.5%" to a float."""
+    if isinstance(value, str):
+        value = value.replace('%', '').strip()
+    return float(value)
+
+def read_cpu_location(stats, location):
+    """Read the CPU usage from a known (field, nested_field) location, or return None."""
+    field, nested_field = location
+    cpu_value = stats.get(field)
+
+    if nested_field is None:
+        if isinstance(cpu_value, (str, int, float)):
+            return parse_cpu_value(cpu_value)
+        return None
+
+    if not isinstance(cpu_value, dict) or nested_field not in cpu_value:
+        return None
+    cpu_raw = parse_cpu_value(cpu_value[nested_field])
+
+    # The Easypanel cpu.percent field is always a decimal fraction
+    if location == ("cpu", "percent"):
+        return cpu_raw * 100
+    if cpu_raw < 1.0 and nested_field in FRACTION_CPU_FIELDS:
+        return cpu_raw * 100
+    return cpu_raw
+
+def find_cpu_location(stats):
+    """Search a stats response for the field holding the CPU usage.
+
+    Tries the Easypanel cpu.percent field first, then top-level CPU
+    fields, then CPU fields nested one level down. Returns a
+    (field, nested_field) location for read_cpu_location, or None.
+    """
+    cpu_data = stats.get("cpu")
+    if isinstance(cpu_data, dict) and "percent" in cpu_data:
+        return ("cpu", "percent")
+
+    for field in CPU_FIELDS:
+        if isinstance(stats.get(field), (str, int, float)):
+            return (field, None)
+
+    for key, value in stats.items():
+        if isinstance(value, dict):
+            for cpu_field in NESTED_CPU_FIELDS:
+                if cpu_field in value:
+                    return (key, cpu_field)
+    return None
+
+def extract_cpu_usage(stats, full_name):
+    """Find the CPU usage percentage in a service stats response.
+
+    Every service reports the same stats shape, so the location found in
+    the first response is tried first on later calls. Returns None if no
+    CPU field is present; raises ValueError or TypeError if the value is
+    not numeric.
+    """
+    global _CPU_LOCATION
+
+    if _CPU_LOCATION is not None:
+        avg_cpu = read_cpu_location(stats, _CPU_LOCATION)
+        if avg_cpu is not None:
+            return avg_cpu
+
+    # Log available stats fields for debugging
+    log("Available stats fields: %s", list(stats.keys()),
+        level="DEBUG",
+        service_name=full_name)
+
+    location = find_cpu_location(stats)
+    if location is None:
+        return None
+
+    avg_cpu = read_cpu_location(stats, location)
+    log("Found CPU usage in '%s': %.2f%%", ".".join(filter(None, location)), avg_cpu,
+        level="DEBUG",
+        service_name=full_name)
+
+    _CPU_LOCATION = location
+    return avg_cpu
+
+def decide_scaling(avg_cpu, prev, replicas, min_r, max_r, up_t, down_t):
+    """Decide how a service should be scaled from its CPU usage and limits.
+
+    Returns an (action, target_replicas) tuple. action is one of
+    "scale_up", "scale_down", "scale_up_skipped", "scale_down_skipped" or
+    "stable"; target_replicas is None unless the service should be scaled.
+    """
+    if avg_cpu >= up_t and replicas < max_r:
+        if prev is None or avg_cpu - prev >= MIN_CPU_CHANGE:
+            return "scale_up", replicas + 1
+        return "scale_up_skipped", None
+    if avg_cpu <= down_t and replicas > min_r:
+        if prev is None or prev - avg_cpu >= MIN_CPU_CHANGE:
+            return "scale_down", replicas - 1
+        return "scale_down_skipped", None
+    return "stable", None
+
+def process_service(service_info, config, ignore_exposed, read_executor, scale_executor, cooldown_cutoff=None):
+    """Evaluate a single service and scale it if its CPU usage requires it.
+
+    Reads go through read_executor; the updateDeploy + deploy sequence runs on
+    the smaller scale_executor so a burst of scale decisions cannot flood the
+    Easypanel backend with concurrent deployments.
+    """
+    result = {"processed": False, "scaled": False, "ignored": False, "error": False}
+
+    project_name = service_info["project"]
+    service_name = service_info["service"]
+    full_name = service_info["full_name"]
+
+    log("Processing service: %s", full_name,
+        level="DEBUG",
+        service_name=full_name,
+        project_name=project_name)
+
+    # Check service configuration
+    svc_cfg = config.get(full_name, {})
+
+    # Check if service is set to be ignored
+    if svc_cfg.get("ignore", False):
+        log("Service is configured to be ignored",
+            level="INFO",
+            service_name=full_name,
+            action="ignored_config")
+        result["ignored"] = True
+        return result
+
+    # Cooldown is a local check, so do it before spending any API calls.
+    # No stats are fetched for a cooling service, so its last_cpu is not
+    # refreshed either: the first run after the cooldown compares its CPU with
+    # the sample taken before the scaling action for MIN_CPU_CHANGE.
+    if is_in_cooldown(full_name, cooldown_cutoff):
+        log("Service is in cooldown period, skipping",
+            level="INFO",
+            service_name=full_name,
+            action="cooldown_skip")
+        result["ignored"] = True
+        return result
+
+    # All three queries take the same input, so serialize it once
+    params = build_service_params(project_name, service_name)
+
+    # The read-only queries are independent, so issue them together and
+    # simply discard stats/replicas if the service turns out to be ignored.
+    # A service can opt in or out of the exposed-ports check on its own
+    exposed_future = None
+    if svc_cfg.get("ignore_exposed", ignore_exposed):
+        exposed_ttl = config.get("global", {}).get("exposed_check_interval", EXPOSED_PORTS_CACHE_SECONDS)
+        exposed_future = read_executor.submit(has_exposed_ports_cached, project_name, service_name, full_name,
+                                              params, exposed_ttl)
+
+    # With batching on, a stale replica count is refreshed by the same
+    # request that fetches the stats instead of a separate inspect call
+    batch = (config.get("api", {}).get("batch_requests", False)
+             and not is_cache_fresh(full_name, "replicas", REPLICAS_CACHE_SECONDS))
+    if batch:
+        stats_future = read_executor.submit(get_stats_and_inspect, project_name, service_name, params)
+        replicas_future = None
+    else:
+        stats_future = read_executor.submit(get_service_stats, project_name, service_name, params)
+        replicas_future = read_executor.submit(get_replicas_cached, project_name, service_name, full_name, params)
+
+    # Check if service has exposed ports and should be ignored
+    if exposed_future is not None and exposed_future.result():
+        log("Service has exposed ports and is set to be ignored",
+            level="INFO",
+            service_name=full_name,
+            action="ignored_exposed")
+        result["ignored"] = True
+        return result
+
+    # Get service stats
+    stats = stats_future.result()
+    if not stats:
+        log("No stats available for service",
+            level="WARNING",
+            service_name=full_name,
+            action="stats_unavailable")
+        result["error"] = True
+        return result
+
+    # Extract CPU usage from stats
+    try:
+        avg_cpu = extract_cpu_usage(stats, full_name)
+
+        if avg_cpu is None:
+            log("CPU stats not found in API response. Available fields: %s", list(stats.keys()),
+                level="WARNING",
+                service_name=full_name,
+                action="cpu_stats_missing",
+                available_fields=list(stats.keys()))
+            result["error"] = True
+            return result
+
+        # Ensure CPU is a reasonable value (0-100%)
+        if avg_cpu < 0:
+            avg_cpu = 0
+        elif avg_cpu > 100:
+            # If value is > 100, it might be in a different scale
+            if avg_cpu > 1000:
+                avg_cpu = avg_cpu / 1000  # Convert from per-mille
+            elif avg_cpu > 100:
+                avg_cpu = avg_cpu / 10   # Convert from per-thousand
+
+    except (ValueError, TypeError) as e:
+        log("Error parsing CPU stats: %s", e,
+            level="ERROR",
+            service_name=full_name,
+            action="cpu_parse_error",
+            stats_data=stats)
+        result["error"] = True
+        return result
+
+    prev = get_previous_avg(full_name)
+    save_avg_cpu(full_name, avg_cpu)
+
+    min_r = svc_cfg.get("min", DEFAULT_MIN_REPLICAS)
+    max_r = svc_cfg.get("max", DEFAULT_MAX_REPLICAS)
+    up_t = svc_cfg.get("up", DEFAULT_UP_THRESHOLD)
+    down_t = svc_cfg.get("down", DEFAULT_DOWN_THRESHOLD)
+
+    if replicas_future is not None:
+        replicas = replicas_future.result()
+    else:
+        replicas = get_replicas_cached(project_name, service_name, full_name, params)
+    result["processed"] = True
+
+    log("Service status - CPU: %.1f%%, Replicas: %s", avg_cpu, replicas,
+        level="INFO",
+        service_name=full_name,
+        cpu_usage=avg_cpu,
+        replicas=replicas,
+        min_replicas=min_r,
+        max_replicas=max_r,
+        up_threshold=up_t,
+        down_threshold=down_t)
+
+    cpu_delta = avg_cpu - prev if prev is not None else None
+
+    action, target_replicas = decide_scaling(avg_cpu, prev, replicas, min_r, max_r, up_t, down_t)
+
+    if target_replicas is not None:
+        scale_future = scale_executor.submit(scale_service, project_name, service_name, target_replicas, full_name)
+        if scale_future.result():
+            result["scaled"] = True
+    elif action == "scale_up_skipped":
+        log("High CPU but no significant rise (Δ: %.1f%%)", cpu_delta,
+            level="INFO",
+            service_name=full_name,
+            action="scale_up_skipped",
+            cpu_delta=cpu_delta)
+    elif action == "scale_down_skipped":
+        log("Low CPU but no significant drop (Δ: %.1f%%)", cpu_delta,
+            level="INFO",
+            service_name=full_name,
+            action="scale_down_skipped",
+            cpu_delta=cpu_delta)
+    else:
+        log("Service is stable, no action needed",
+            level="DEBUG",
+            service_name=full_name,
+            action="stable")
+
+    return result
+
+def get_worker_count(global_config, key, default):
+    """Read a thread pool size from the global config, or default if it is not a positive int."""
+    value = global_config.get(key, default)
+    # bool is an int subclass, but true/false is never meant as a count
+    if type(value) is not int or value < 1:
+        log("Invalid global.%s value %r, using the default of %s", key, value, default, level="WARNING")
+        return default
+    return value
 
 def main():
+    config = load_config()
+
     # Initialize logging first
-    setup_logging()
+    setup_logging(config)
 
     log("🌀 Starting autoscaler run", level="INFO")
     run_start_time = time.time()
 
+    state_loaded = False
     try:
-        config = load_config()
+        load_state()
+        state_loaded = True
+
         # Get global configuration settings
         global_config = config.get("global", {})
         ignore_exposed = global_config.get("ignore_exposed", DEFAULT_IGNORE_EXPOSED)
 
-        log(f"Configuration loaded - ignore_exposed: {ignore_exposed}",
+        log("Configuration loaded - ignore_exposed: %s", ignore_exposed,
             level="DEBUG")
 
+        concurrency = get_worker_count(global_config, "concurrency", DEFAULT_CONCURRENCY)
+        scale_concurrency = get_worker_count(global_config, "scale_concurrency", DEFAULT_SCALE_CONCURRENCY)
+
+        # Each service issues up to three reads at once, and the deploy threads
+        # share the same session. Size the pool before the first request so
+        # the connections it opens are kept for the rest of the run.
+        read_workers = concurrency * 3
+        mount_http_adapters(read_workers + scale_concurrency)
+
         # Get all services from Easypanel
         services = get_projects_and_services()
         if not services:
             log("No services found or API error", level="WARNING")
             return
 
-        log(f"Processing {len(services)} services", level="INFO")
-
-        services_processed = 0
-        services_scaled = 0
-        services_ignored = 0
-        services_errors = 0
+        log("Processing %s services", len(services), level="INFO")
 
-        for service_info in services:
-            project_name = service_info["project"]
-            service_name = service_info["service"]
-            full_name = service_info["full_name"]
+        # Services scaled after this moment are still cooling down
+        cooldown_cutoff = run_start_time - COOLDOWN_MINUTES * 60
 
-            log(f"Processing service: {full_name}",
-                level="DEBUG",
-                service_name=full_name,
-                project_name=project_name)
-
-            # Check service configuration
-            svc_cfg = config.get(full_name, {})
-
-            # Check if service is set to be ignored
-            if svc_cfg.get("ignore", False):
-                log(f"Service is configured to be ignored",
-                    level="INFO",
-                    service_name=full_name,
-                    action="ignored_config")
-                services_ignored += 1
-                continue
-
-            # Check if service has exposed ports and should be ignored
-            if ignore_exposed and has_exposed_ports(project_name, service_name):
-                log(f"Service has exposed ports and is set to be ignored",
-                    level="INFO",
-                    service_name=full_name,
-                    action="ignored_exposed")
-                services_ignored += 1
-                continue
-
-            # Get service stats
-            stats = get_service_stats(project_name, service_name)
-            if not stats:
-                log(f"No stats available for service",
-                    level="WARNING",
-                    service_name=full_name,
-                    action="stats_unavailable")
-                services_errors += 1
-                continue
+        # Services are independent, so overlap their API round-trips
+        results = []
+        with ThreadPoolExecutor(max_workers=read_workers) as read_executor, \
+                ThreadPoolExecutor(max_workers=scale_concurrency) as scale_executor, \
+                ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = {
+                executor.submit(process_service, service_info, config, ignore_exposed,
+                                read_executor, scale_executor, cooldown_cutoff): service_info
+                for service_info in services
+            }
 
-            # Extract CPU usage from stats
-            avg_cpu = None
-            try:
-                # Log available stats fields for debugging
-                log(f"Available stats fields: {list(stats.keys())}",
-                    level="DEBUG",
-                    service_name=full_name)
-
-                # Handle the specific Easypanel API format
-                if "cpu" in stats and isinstance(stats["cpu"], dict):
-                    cpu_data = stats["cpu"]
-                    if "percent" in cpu_data:
-                        # CPU percent is returned as a decimal (0.042639974976540505 = 4.26%)
-                        avg_cpu = float(cpu_data["percent"]) * 100
-                        log(f"Found CPU usage in 'cpu.percent': {avg_cpu:.2f}%",
-                            level="DEBUG",
-                            service_name=full_name)
-
-                # Fallback: Try different possible CPU field names
-                if avg_cpu is None:
-                    cpu_fields = ["cpu", "cpuUsage", "cpuPercent", "cpuPercentage", "CPU", "cpu_usage", "cpu_percent"]
-
-                    for field in cpu_fields:
-                        if field in stats:
-                            cpu_value = stats[field]
-                            # Handle different formats (percentage string, float, etc.)
-                            if isinstance(cpu_value, str):
-                                # Remove % sign if present
-                                cpu_value = cpu_value.replace('%', '').strip()
-                                avg_cpu = float(cpu_value)
-                            elif isinstance(cpu_value, (int, float)):
-                                avg_cpu = float(cpu_value)
-                            elif isinstance(cpu_value, dict):
-                                # Skip dict values in this loop, handled above
-                                continue
-
-                            log(f"Found CPU usage in field '{field}': {avg_cpu}%",
-                                level="DEBUG",
-                                service_name=full_name)
-                            break
-
-                # Final fallback: Try to find CPU in nested objects
-                if avg_cpu is None:
-                    for key, value in stats.items():
-                        if isinstance(value, dict):
-                            nested_cpu_fields = ["percent", "percentage", "cpu", "cpuUsage", "cpuPercent"]
-                            for cpu_field in nested_cpu_fields:
-                                if cpu_field in value:
-                                    cpu_value = value[cpu_field]
-                                    if isinstance(cpu_value, str):
-                                        cpu_value = cpu_value.replace('%', '').strip()
-                                    cpu_raw = float(cpu_value)
-
-                                    # If it's a decimal less than 1, assume it's a percentage in decimal form
-                                    if cpu_raw < 1.0 and cpu_field in ["percent", "percentage"]:
-                                        avg_cpu = cpu_raw * 100
-                                    else:
-                                        avg_cpu = cpu_raw
-
-                                    log(f"Found CPU usage in nested field '{key}.{cpu_field}': {avg_cpu:.2f}%",
-                                        level="DEBUG",
-                                        service_name=full_name)
-                                    break
-                        if avg_cpu is not None:
-                            break
-
-                if avg_cpu is None:
-                    log(f"CPU stats not found in API response. Available fields: {list(stats.keys())}",
-                        level="WARNING",
+            for future in as_completed(futures):
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    # One broken service must not hide the results of the others
+                    full_name = futures[future]["full_name"]
+                    log("Unexpected error processing service: %s", e,
+                        level="ERROR",
                         service_name=full_name,
-                        action="cpu_stats_missing",
-                        available_fields=list(stats.keys()))
-                    services_errors += 1
-                    continue
-
-                # Ensure CPU is a reasonable value (0-100%)
-                if avg_cpu < 0:
-                    avg_cpu = 0
-                elif avg_cpu > 100:
-                    # If value is > 100, it might be in a different scale
-                    if avg_cpu > 1000:
-                        avg_cpu = avg_cpu / 1000  # Convert from per-mille
-                    elif avg_cpu > 100:
-                        avg_cpu = avg_cpu / 10   # Convert from per-thousand
-
-            except (ValueError, TypeError) as e:
-                log(f"Error parsing CPU stats: {e}",
-                    level="ERROR",
-                    service_name=full_name,
-                    action="cpu_parse_error",
-                    stats_data=stats)
-                services_errors += 1
-                continue
-
-            prev = get_previous_avg(full_name)
-            save_avg_cpu(full_name, avg_cpu)
-
-            min_r = svc_cfg.get("min", DEFAULT_MIN_REPLICAS)
-            max_r = svc_cfg.get("max", DEFAULT_MAX_REPLICAS)
-            up_t = svc_cfg.get("up", DEFAULT_UP_THRESHOLD)
-            down_t = svc_cfg.get("down", DEFAULT_DOWN_THRESHOLD)
+                        action="process_error")
+                    results.append({"processed": False, "scaled": False, "ignored": False, "error": True})
 
-            replicas = get_replicas(project_name, service_name)
-            services_processed += 1
-
-            log(f"Service status - CPU: {avg_cpu:.1f}%, Replicas: {replicas}",
-                level="INFO",
-                service_name=full_name,
-                cpu_usage=avg_cpu,
-                replicas=replicas,
-                min_replicas=min_r,
-                max_replicas=max_r,
-                up_threshold=up_t,
-                down_threshold=down_t)
-
-            if is_in_cooldown(full_name):
-                log(f"Service is in cooldown period, skipping",
-                    level="INFO",
-                    service_name=full_name,
-                    action="cooldown_skip")
-                continue
-
-            cpu_delta = avg_cpu - prev if prev is not None else None
-
-            if avg_cpu >= up_t and replicas < max_r:
-                if prev is None or cpu_delta >= 5:
-                    if scale_service(project_name, service_name, replicas + 1, full_name):
-                        services_scaled += 1
-                else:
-                    log(f"High CPU but no significant rise (Δ: {cpu_delta:.1f}%)",
-                        level="INFO",
-                        service_name=full_name,
-                        action="scale_up_skipped",
-                        cpu_delta=cpu_delta)
-            elif avg_cpu <= down_t and replicas > min_r:
-                if prev is None or (prev - avg_cpu) >= 5:
-                    if scale_service(project_name, service_name, replicas - 1, full_name):
-                        services_scaled += 1
-                else:
-                    log(f"Low CPU but no significant drop (Δ: {cpu_delta:.1f}%)",
-                        level="INFO",
-                        service_name=full_name,
-                        action="scale_down_skipped",
-                        cpu_delta=cpu_delta)
-            else:
-                log(f"Service is stable, no action needed",
-                    level="DEBUG",
-                    service_name=full_name,
-                    action="stable")
+        services_processed = sum(r["processed"] for r in results)
+        services_scaled = sum(r["scaled"] for r in results)
+        services_ignored = sum(r["ignored"] for r in results)
+        services_errors = sum(r["error"] for r in results)
 
         # Calculate run statistics
         run_time = round(time.time() - run_start_time, 2)
 
-        log(f"Autoscaler run completed",
+        log("Autoscaler run completed",
             level="INFO",
             run_time_seconds=run_time,
             services_total=len(services),
@@ -964,8 +1409,32 @@ def main():
             services_errors=services_errors)
 
     except Exception as e:
-        log(f"Fatal error in autoscaler: {e}",
+        log("Fatal error in autoscaler: %s", e,
             level="CRITICAL")
         raise
 
-main()
\ No newline at end of file
+    finally:
+        # Persist cooldown and CPU history even if the run failed part-way,
+        # but never overwrite a state file that could not be read
+        if state_loaded:
+            save_state()
+
+def run_profiled():
+    """Run main() under cProfile and write the stats to the profile/ directory."""
+    # Only needed when profiling, so keep it off the normal startup path
+    import cProfile
+
+    profile_dir = os.path.join(APP_DIR, "profile")
+    os.makedirs(profile_dir, exist_ok=True)
+
+    profiler = cProfile.Profile()
+    try:
+        profiler.runcall(main)
+    finally:
+        profiler.dump_stats(os.path.join(profile_dir, "profile.pstats"))
+
+if __name__ == "__main__":
+    if "--profile" in sys.argv[1:]:
+        run_profiled()
+    else:
+        main()
@@ -30,6 +30,13 @@ def get_api_config():
 
     return base_url.rstrip('/'), token
 
+def unwrap_trpc(response):
+    """Return the payload of a standard tRPC response (result.data.json), or None"""
+    try:
+        return response["result"]["data"]["json"]
+    except (KeyError, TypeError):
+        return None
+
 def make_api_request(endpoint, params=None, method="GET", data=None):
     """Make a request to the Easypanel API"""
     base_url, token = get_api_config()
@@ -73,7 +80,7 @@ def make_api_request(endpoint, params=None, method="GET", data=None):
         return None
 
 def test_projects_and_services():
-    """Test the projects and services endpoint"""
+    """Test the projects and services endpoint and return its response"""
     print("\n" + "="*60)
     print("🧪 Testing Projects and Services API")
     print("="*60)
@@ -124,6 +131,8 @@ def test_projects_and_services():
                         for key, project in list(result.items())[:3]:
                             print(f"Project key '{key}': {project}")
 
+    return response
+
 def test_service_stats(project_name, service_name):
     """Test the service stats endpoint"""
     print("\n" + "="*60)
@@ -153,20 +162,13 @@ def main():
     print("This tool helps debug API responses for the autoscaler")
 
     # Test projects and services
-    test_projects_and_services()
+    response = test_projects_and_services()
 
     # If we have projects, test service stats for the first service
     try:
-        response = make_api_request("/api/trpc/projects.listProjectsAndServices")
         if response and isinstance(response, dict):
             # Navigate to projects data
-            projects_data = None
-            if "result" in response:
-                result = response["result"]
-                if isinstance(result, dict) and "data" in result:
-                    data = result["data"]
-                    if isinstance(data, dict) and "json" in data:
-                        projects_data = data["json"]
+            projects_data = unwrap_trpc(response)
 
             # Handle both list and dict formats
             projects_list = []
@@ -0,0 +1,276 @@
+"""
+Tests to verify the autoscaler's state migration and scaling decisions.
+"""
+
+import json
+import logging
+import warnings
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+import requests
+import urllib3
+
+import autoscaler
+
+LAST_SCALED = "2024-05-01T12:30:00"
+
+@pytest.fixture(autouse=True)
+def app_dir(tmp_path, monkeypatch):
+    """Point the state and log files at a temporary app directory
+
+    A logger without handlers is installed up front, so log() never runs the
+    real setup_logging() and records are left to pytest's caplog.
+    """
+    monkeypatch.setattr(autoscaler, "STATE_FILE", str(tmp_path / "state.json"))
+    monkeypatch.setattr(autoscaler, "LEGACY_STATE_DIR", str(tmp_path / "state"))
+    monkeypatch.setattr(autoscaler, "LOG_FILE", str(tmp_path / "autoscaler.log"))
+    monkeypatch.setattr(autoscaler, "logger", logging.getLogger("autoscaler"))
+    monkeypatch.setattr(autoscaler, "_STATE", {"last_scaled": {}, "last_cpu": {}, "api_cache": {}})
+    monkeypatch.setattr(autoscaler, "_CPU_LOCATION", None)
+    return tmp_path
+
+def test_migrate_legacy_state(app_dir, caplog):
+    """Legacy .last/.cpu files are imported and malformed ones skipped"""
+    legacy_dir = app_dir / "state"
+    legacy_dir.mkdir()
+    legacy_files = {
+        "proj_web.last": LAST_SCALED,
+        "proj_web.cpu": "42.5\n",
+        "proj_api.cpu": "63",
+        "proj_bad.last": "yesterday",
+        "proj_bad.cpu": "not a number",
+    }
+    for name, content in legacy_files.items():
+        (legacy_dir / name).write_text(content)
+
+    state = autoscaler.load_state()
+
+    assert state["last_scaled"] == {"proj_web": datetime.fromisoformat(LAST_SCALED).timestamp()}
+    assert state["last_cpu"] == {"proj_web": 42.5, "proj_api": 63.0}
+    skipped = sorted(record.args[0] for record in caplog.records if record.levelno == logging.WARNING)
+    assert skipped == ["proj_bad.cpu", "proj_bad.last"]
+
+# (avg_cpu, prev, replicas, min_r, max_r, up_t, down_t), expected decision
+# per case, with thresholds of 80% up and 20% down
+SCALING_CASES = [
+    pytest.param((85, None, 2, 1, 5, 80, 20), ("scale_up", 3), id="scale_up"),
+    pytest.param((85, 70, 2, 1, 5, 80, 20), ("scale_up", 3), id="scale_up_after_rise"),
+    pytest.param((85, 82, 2, 1, 5, 80, 20), ("scale_up_skipped", None), id="scale_up_small_rise"),
+    pytest.param((95, None, 5, 1, 5, 80, 20), ("stable", None), id="at_max"),
+    pytest.param((10, None, 3, 1, 5, 80, 20), ("scale_down", 2), id="scale_down"),
+    pytest.param((10, 30, 3, 1, 5, 80, 20), ("scale_down", 2), id="scale_down_after_drop"),
+    pytest.param((10, 12, 3, 1, 5, 80, 20), ("scale_down_skipped", None), id="scale_down_small_drop"),
+    pytest.param((5, None, 1, 1, 5, 80, 20), ("stable", None), id="at_min"),
+    pytest.param((50, None, 2, 1, 5, 80, 20), ("stable", None), id="between_thresholds"),
+    pytest.param((80, None, 2, 1, 5, 80, 20), ("scale_up", 3), id="on_up_threshold"),
+    pytest.param((20, None, 2, 1, 5, 80, 20), ("scale_down", 1), id="on_down_threshold"),
+]
+
+@pytest.mark.parametrize("args,expected", SCALING_CASES)
+def test_decide_scaling(args, expected):
+    """Test the scaling decision for each CPU and replica combination"""
+    assert autoscaler.decide_scaling(*args) == expected
+
+def test_load_state(app_dir):
+    """A valid state file is loaded as-is"""
+    (app_dir / "state.json").write_bytes(b'{"last_scaled": {"proj_web": 1700000000.0}, "last_cpu": {"proj_web": 42.5}}')
+
+    state = autoscaler.load_state()
+
+    assert state == {"last_scaled": {"proj_web": 1700000000.0}, "last_cpu": {"proj_web": 42.5}, "api_cache": {}}
+
+@pytest.mark.parametrize("content", [
+    pytest.param(b'{"last_scaled": ', id="truncated"),
+    pytest.param(b"\xff", id="not_utf8"),
+    pytest.param(b"[1, 2]", id="not_an_object"),
+    pytest.param(b'{"last_scaled": null, "last_cpu": {}}', id="null_section"),
+    pytest.param(b'{"api_cache": []}', id="list_section"),
+])
+def test_load_state_corrupt(app_dir, caplog, content):
+    """A corrupt state file is moved aside and the run starts with empty state"""
+    (app_dir / "state.json").write_bytes(content)
+
+    state = autoscaler.load_state()
+
+    assert state == {"last_scaled": {}, "last_cpu": {}, "api_cache": {}}
+    assert not (app_dir / "state.json").exists()
+    assert (app_dir / "state.json.corrupt").read_bytes() == content
+    assert any(record.levelno == logging.WARNING for record in caplog.records)
+
+@pytest.mark.parametrize("loader", [
+    pytest.param(autoscaler.load_json, id="load_json"),
+    pytest.param(json.loads, id="stdlib"),
+])
+@pytest.mark.parametrize("body", [
+    pytest.param(b"<html>Bad Gateway</html>", id="not_json"),
+    pytest.param(b"\xff", id="not_utf8"),
+])
+def test_make_api_request_invalid_body(monkeypatch, caplog, loader, body):
+    """An undecodable body is logged and reported as a failed request"""
+    response = SimpleNamespace(ok=True, status_code=200, reason="OK", content=body)
+    monkeypatch.setattr(autoscaler, "get_api_sender", lambda endpoint, method: lambda **kwargs: response)
+    monkeypatch.setattr(autoscaler, "load_json", loader)
+
+    assert autoscaler.make_api_request("/api/trpc/projects.listProjectsAndServices") is None
+    assert "API returned invalid JSON: %s" in [record.msg for record in caplog.records]
+
+@pytest.mark.parametrize("value,expected", [
+    pytest.param(8, 8, id="valid"),
+    pytest.param(0, 16, id="zero"),
+    pytest.param(-2, 16, id="negative"),
+    pytest.param("8", 16, id="string"),
+    pytest.param(2.5, 16, id="float"),
+    pytest.param(True, 16, id="bool"),
+    pytest.param(None, 16, id="null"),
+])
+def test_get_worker_count(value, expected):
+    """Worker counts fall back to the default unless they are positive ints"""
+    assert autoscaler.get_worker_count({"concurrency": value}, "concurrency", 16) == expected
+
+def test_get_worker_count_missing(caplog):
+    """A missing key uses the default without a warning"""
+    assert autoscaler.get_worker_count({}, "scale_concurrency", 4) == 4
+    assert not caplog.records
+
+def insecure_request_warning(host):
+    return urllib3.exceptions.InsecureRequestWarning(
+        f"Unverified HTTPS request is being made to host '{host}'. Adding certificate verification is strongly advised.")
+
+def test_api_session_insecure_warnings(monkeypatch):
+    """With verify_ssl off, only warnings about the API host are silenced"""
+    monkeypatch.setattr(autoscaler, "_SESSION", requests.Session())
+    monkeypatch.setattr(autoscaler, "get_api_config", lambda: ("https://panel.example.com:3000", "token", False))
+
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        session = autoscaler.get_api_session.__wrapped__()
+        warnings.warn(insecure_request_warning("panel.example.com"))
+        warnings.warn(insecure_request_warning("other.example.com"))
+
+    assert session.verify is False
+    assert [str(w.message) for w in caught] == [str(insecure_request_warning("other.example.com"))]
+
+@pytest.mark.parametrize("stats,expected", [
+    pytest.param({"cpu": {"percent": 0.425}}, 42.5, id="easypanel_fraction"),
+    pytest.param({"cpu": {"percent": 1.5}}, 150.0, id="easypanel_multi_core"),
+    pytest.param({"cpuUsage": "55.5%"}, 55.5, id="top_level_string"),
+    pytest.param({"cpu_percent": 30}, 30.0, id="top_level_number"),
+    pytest.param({"metrics": {"percentage": 0.5}}, 50.0, id="nested_fraction"),
+    pytest.param({"metrics": {"percentage": 12}}, 12.0, id="nested_percentage"),
+    pytest.param({"metrics": {"cpuUsage": 0.5}}, 0.5, id="nested_not_a_fraction"),
+    pytest.param({"memory": {"usage": 100}}, None, id="no_cpu_field"),
+])
+def test_extract_cpu_usage(stats, expected):
+    """The CPU usage is found in each supported stats shape"""
+    assert autoscaler.extract_cpu_usage(stats, "proj_web") == pytest.approx(expected)
+
+def test_extract_cpu_usage_cached_location():
+    """A cached location is reused, and a different shape falls back to a full search"""
+    assert autoscaler.extract_cpu_usage({"cpu": {"percent": 0.25}}, "proj_web") == pytest.approx(25.0)
+    assert autoscaler._CPU_LOCATION == ("cpu", "percent")
+
+    assert autoscaler.extract_cpu_usage({"cpu": {"percent": 0.5}, "cpuUsage": 90}, "proj_api") == pytest.approx(50.0)
+    assert autoscaler.extract_cpu_usage({"cpuUsage": 60}, "proj_db") == pytest.approx(60.0)
+    assert autoscaler._CPU_LOCATION == ("cpuUsage", None)
+
+    assert autoscaler.extract_cpu_usage({"cpu": {"percent": 0.1}}, "proj_web") == pytest.approx(10.0)
+    assert autoscaler.extract_cpu_usage({"memory": {"usage": 100}}, "proj_worker") is None
+    assert autoscaler._CPU_LOCATION == ("cpu", "percent")
+
+@pytest.mark.parametrize("stats", [
+    pytest.param({"cpu": {"percent": "n/a"}}, id="nested"),
+    pytest.param({"cpuUsage": "n/a"}, id="top_level"),
+])
+def test_extract_cpu_usage_not_numeric(stats):
+    """A CPU field that is not numeric raises ValueError"""
+    with pytest.raises(ValueError):
+        autoscaler.extract_cpu_usage(stats, "proj_web")
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replace the autoscaler's clock with one the test can move"""
+    now = [1700000000.0]
+    monkeypatch.setattr(autoscaler, "time", SimpleNamespace(time=lambda: now[0]))
+    return now
+
+@pytest.mark.parametrize("age,fresh", [
+    pytest.param(0, True, id="just_stored"),
+    pytest.param(59.999, True, id="before_ttl"),
+    pytest.param(60, False, id="at_ttl"),
+    pytest.param(61, False, id="after_ttl"),
+])
+def test_is_cache_fresh(clock, age, fresh):
+    """A cached value is fresh for strictly less than its TTL"""
+    autoscaler.store_cached_value("proj_web", "replicas", 3)
+    clock[0] += age
+    assert autoscaler.is_cache_fresh("proj_web", "replicas", 60) is fresh
+
+def test_is_cache_fresh_missing(clock):
+    """Unknown services and keys, and entries without a timestamp, are stale"""
+    autoscaler._STATE["api_cache"]["proj_api"] = {"replicas": 2}
+    autoscaler.store_cached_value("proj_web", "exposed", False)
+    assert not autoscaler.is_cache_fresh("proj_db", "replicas", 60)
+    assert not autoscaler.is_cache_fresh("proj_web", "replicas", 60)
+    assert not autoscaler.is_cache_fresh("proj_api", "replicas", 60)
+
+def test_get_cached_value(clock):
+    """fetch() runs again only once the TTL expired, and None is never cached"""
+    calls = []
+
+    def fetch():
+        calls.append(clock[0])
+        return len(calls)
+
+    assert autoscaler.get_cached_value("proj_web", "replicas", 60, fetch) == 1
+    clock[0] += 30
+    assert autoscaler.get_cached_value("proj_web", "replicas", 60, fetch) == 1
+    clock[0] += 30
+    assert autoscaler.get_cached_value("proj_web", "replicas", 60, fetch) == 2
+    assert len(calls) == 2
+
+    assert autoscaler.get_cached_value("proj_api", "replicas", 60, lambda: None) is None
+    assert "proj_api" not in autoscaler._STATE["api_cache"]
+
+@pytest.mark.parametrize("response,expected", [
+    pytest.param({"result": {"data": {"json": [1, 2]}}}, [1, 2], id="envelope"),
+    pytest.param({"data": {"json": {"a": 1}}}, {"a": 1}, id="no_result"),
+    pytest.param({"result": {"data": 5}}, 5, id="no_json"),
+    pytest.param([1, 2], [1, 2], id="bare_payload"),
+    pytest.param(None, None, id="none"),
+])
+def test_unwrap_trpc(response, expected):
+    """The payload is found however much of the tRPC envelope is present"""
+    assert autoscaler.unwrap_trpc(response) == expected
+
+BATCH_CALLS = [
+    ("/api/trpc/monitor.getServiceStats", {"input": '{"json":{"projectName":"proj","serviceName":"web"}}'}),
+    ("/api/trpc/services.app.inspectService", {"input": '{"json":{"projectName":"proj","serviceName":"web"}}'}),
+]
+
+@pytest.mark.parametrize("response,expected", [
+    pytest.param([{"result": {"data": 1}}, {"result": {"data": 2}}],
+                 [{"result": {"data": 1}}, {"result": {"data": 2}}], id="all_ok"),
+    pytest.param([{"result": {"data": 1}}, {"error": {"message": "not found"}}],
+                 [{"result": {"data": 1}}, None], id="one_error"),
+    pytest.param([{"result": {"data": 1}}], [None, None], id="wrong_length"),
+    pytest.param({"result": {"data": 1}}, [None, None], id="not_a_list"),
+    pytest.param(None, [None, None], id="request_failed"),
+])
+def test_batch_api_request(monkeypatch, response, expected):
+    """A batch response is split into one result per call, None where a call failed"""
+    requests_made = []
+
+    def make_api_request(endpoint, params=None):
+        requests_made.append((endpoint, params))
+        return response
+
+    monkeypatch.setattr(autoscaler, "make_api_request", make_api_request)
+
+    assert autoscaler.batch_api_request(BATCH_CALLS) == expected
+    assert requests_made == [(
+        "/api/trpc/monitor.getServiceStats,services.app.inspectService",
+        {"batch": "1", "input": '{"0":{"json":{"projectName":"proj","serviceName":"web"}},'
+                                '"1":{"json":{"projectName":"proj","serviceName":"web"}}}'},
+    )]
@@ -1,182 +1,286 @@
-#!/usr/bin/env python3
 """
-Test script to verify the API response parsing logic works correctly.
+Tests to verify the API response parsing logic works correctly.
 """
 
-def test_projects_parsing():
-    """Test different project response formats"""
-    
-    # Test case 1: List format
-    print("🧪 Testing list format...")
-    list_response = {
-        "result": {
-            "data": {
-                "json": [
-                    {
-                        "name": "project1",
-                        "services": [
-                            {"name": "web"},
-                            {"name": "api"}
-                        ]
-                    },
-                    {
-                        "name": "project2", 
-                        "services": [
-                            {"name": "database"}
-                        ]
-                    }
-                ]
-            }
-        }
-    }
-    
-    services = parse_projects_response(list_response)
-    print(f"✅ List format: Found {len(services)} services")
-    for service in services:
-        print(f"   - {service['full_name']}")
-    
-    # Test case 2: Single project dict format
-    print("\n🧪 Testing single project dict format...")
-    single_dict_response = {
-        "result": {
-            "data": {
-                "json": {
-                    "name": "myproject",
+import functools
+import logging
+from operator import itemgetter
+from typing import NamedTuple
+
+import pytest
+
+try:
+    import orjson
+    json_loads = orjson.loads
+    json_dumps = orjson.dumps
+except ImportError:  # orjson is optional, fall back to the stdlib parser
+    import json
+    json_loads = json.loads
+
+    def json_dumps(obj):
+        return json.dumps(obj).encode()
+
+logger = logging.getLogger(__name__)
+get_name = itemgetter("name")
+
+class Service(NamedTuple):
+    """A service found in a projects response"""
+    project: str
+    service: str
+
+    @property
+    def full_name(self):
+        # Built on access, most consumers only need project and service
+        return f"{self.project}_{self.service}"
+
+LIST_RESPONSE = {
+    "result": {
+        "data": {
+            "json": [
+                {
+                    "name": "project1",
                     "services": [
                         {"name": "web"},
-                        {"name": "worker"}
+                        {"name": "api"}
+                    ]
+                },
+                {
+                    "name": "project2", 
+                    "services": [
+                        {"name": "database"}
                     ]
                 }
+            ]
+        }
+    }
+}
+
+SINGLE_DICT_RESPONSE = {
+    "result": {
+        "data": {
+            "json": {
+                "name": "myproject",
+                "services": [
+                    {"name": "web"},
+                    {"name": "worker"}
+                ]
             }
         }
     }
-    
-    services = parse_projects_response(single_dict_response)
-    print(f"✅ Single dict format: Found {len(services)} services")
-    for service in services:
-        print(f"   - {service['full_name']}")
-    
-    # Test case 3: Multiple projects dict format
-    print("\n🧪 Testing multiple projects dict format...")
-    multi_dict_response = {
-        "result": {
-            "data": {
-                "json": {
-                    "proj1": {
-                        "name": "project1",
-                        "services": [{"name": "app"}]
-                    },
-                    "proj2": {
-                        "name": "project2", 
-                        "services": [{"name": "db"}]
-                    }
+}
+
+MULTI_DICT_RESPONSE = {
+    "result": {
+        "data": {
+            "json": {
+                "proj1": {
+                    "name": "project1",
+                    "services": [{"name": "app"}]
+                },
+                "proj2": {
+                    "name": "project2", 
+                    "services": [{"name": "db"}]
                 }
             }
         }
     }
-    
-    services = parse_projects_response(multi_dict_response)
-    print(f"✅ Multi dict format: Found {len(services)} services")
-    for service in services:
-        print(f"   - {service['full_name']}")
+}
 
-def parse_projects_response(response):
-    """Simulate the parsing logic from autoscaler.py"""
-    services = []
+# Every kind of bad entry iter_services() has to skip, next to good ones
+MALFORMED_RESPONSE = {
+    "result": {
+        "data": {
+            "json": [
+                {"services": [{"name": "orphan"}]},
+                {"name": "", "services": [{"name": "orphan"}]},
+                "not a project",
+                {"name": "broken", "services": "not a list"},
+                {
+                    "name": "mixed",
+                    "services": [
+                        {"name": "web"},
+                        "not a service",
+                        {},
+                        {"name": ""},
+                        {"name": "worker"}
+                    ]
+                },
+                {"name": "empty"},
+                {"name": "ok", "services": [{"name": "api"}]}
+            ]
+        }
+    }
+}
+
+# (response, expected full names) per case; the list format is fed as the
+# raw body, as make_api_request would receive it
+PARSING_CASES = [
+    pytest.param(json_dumps(LIST_RESPONSE), ["project1_web", "project1_api", "project2_database"], id="list"),
+    pytest.param(SINGLE_DICT_RESPONSE, ["myproject_web", "myproject_worker"], id="single_dict"),
+    pytest.param(MULTI_DICT_RESPONSE, ["project1_app", "project2_db"], id="multi_dict"),
+    pytest.param(MALFORMED_RESPONSE, ["mixed_web", "mixed_worker", "ok_api"], id="malformed"),
+    pytest.param(json_dumps(MALFORMED_RESPONSE), ["mixed_web", "mixed_worker", "ok_api"], id="malformed_body"),
+    pytest.param(b"not json", [], id="invalid_body"),
+]
+
+@pytest.mark.parametrize("response,expected", PARSING_CASES)
+def test_projects_parsing(response, expected):
+    """Test different project response formats"""
+    services = parse_projects_response(response)
+    assert [service.full_name for service in services] == expected
+
+def test_projects_body_cache():
+    """An unchanged body is served from the parse_projects_body cache"""
+    body = json_dumps(LIST_RESPONSE)
+    first = parse_projects_response(body)
+    hits = parse_projects_body.cache_info().hits
+    second = parse_projects_response(bytearray(body))
+    assert second == first
+    assert parse_projects_body.cache_info().hits == hits + 1
+
+# Where the projects payload may sit in a response, most common first, with
+# the type accepted at that location (None accepts anything)
+PAYLOAD_PATHS = (
+    (("result", "data", "json"), None),
+    (("result", "data"), list),
+    (("result",), list),
+    (("data", "json"), None),
+    (("data",), list),
+    ((), list),
+)
+
+def extract_projects_payload(response):
+    """Return the projects payload of a tRPC response, or None"""
+    for path, expected_type in PAYLOAD_PATHS:
+        node = response
+        try:
+            for key in path:
+                node = node[key]
+        except (KeyError, TypeError):
+            continue
+        if expected_type is None or type(node) is expected_type:
+            return node
+    return None
+
+def iter_services(response):
+    """Yield the services of a projects response one Service at a time
+
+    response may be the decoded response or the raw response body.
+    """
+    if isinstance(response, (bytes, bytearray)):
+        response = json_loads(response)
+
+    result = extract_projects_payload(response)
     
-    try:
-        # Handle different possible response structures
-        result = None
-        
-        if isinstance(response, dict):
-            # Standard tRPC response format
-            if "result" in response:
-                result_data = response["result"]
-                if isinstance(result_data, dict) and "data" in result_data:
-                    data = result_data["data"]
-                    if isinstance(data, dict) and "json" in data:
-                        result = data["json"]
-                    elif isinstance(data, list):
-                        result = data
-                elif isinstance(result_data, list):
-                    result = result_data
-            # Direct data format
-            elif "data" in response:
-                data = response["data"]
-                if isinstance(data, dict) and "json" in data:
-                    result = data["json"]
-                elif isinstance(data, list):
-                    result = data
-            # Direct list format
-            elif isinstance(response, list):
-                result = response
-        elif isinstance(response, list):
-            result = response
-        
-        if result is None:
-            print("❌ Could not find projects data in API response")
-            return []
-        
-        # Handle both list and dict formats
-        projects_list = []
-        if isinstance(result, list):
-            projects_list = result
-        elif isinstance(result, dict):
-            # If it's a dict, it might be a single project or a dict of projects
-            if "name" in result and "services" in result:
-                # Single project format
-                projects_list = [result]
-                print("📝 API returned single project format")
-            else:
-                # Dict of projects (key-value pairs)
-                projects_list = list(result.values())
-                print("📝 API returned projects as dictionary values")
+    # The JSON decoder only produces exact dict/list instances, so the
+    # checks below compare types directly instead of calling isinstance
+    if result is None:
+        logger.error("❌ Could not find projects data in API response")
+        return
+    
+    # Normalize every format to one sized iterable of projects up front, so
+    # the walk below has a single loop shape whatever the response looked like
+    if type(result) is list:
+        projects_list = result
+    elif type(result) is dict:
+        # If it's a dict, it might be a single project or a dict of projects
+        if "name" in result and "services" in result:
+            # Single project format
+            projects_list = (result,)
+            logger.debug("📝 API returned single project format")
         else:
-            print(f"❌ Unexpected projects data format: {type(result)}")
-            return []
-        
-        print(f"📝 Processing {len(projects_list)} projects from API")
+            # Dict of projects (key-value pairs), iterated in place
+            projects_list = result.values()
+            logger.debug("📝 API returned projects as dictionary values")
+    else:
+        logger.error("❌ Unexpected projects data format: %s", type(result))
+        return
+    
+    logger.debug("📝 Processing %s projects from API", len(projects_list))
+    
+    for project in projects_list:
+        if type(project) is not dict:
+            logger.warning("⚠️ Expected project to be a dict, got %s: %s", type(project), project)
+            continue
+            
+        try:
+            project_name = project["name"]
+        except KeyError:
+            project_name = None
+        if not project_name:
+            logger.warning("⚠️ Project missing name field: %s", project)
+            continue
         
-        for project in projects_list:
-            if not isinstance(project, dict):
-                print(f"⚠️ Expected project to be a dict, got {type(project)}: {project}")
-                continue
-                
-            project_name = project.get("name", "")
-            if not project_name:
-                print(f"⚠️ Project missing name field: {project}")
-                continue
+        project_services = project.get("services", [])
+
+        # Happy path: a single walk that fails fast on anything other than
+        # services with non-empty names; the checks below only run then
+        try:
+            service_names = list(map(get_name, project_services))
+        except (KeyError, TypeError):
+            service_names = None
+        if service_names is not None and all(service_names):
+            yield from (Service(project_name, name) for name in service_names)
+            continue
+
+        if type(project_services) is not list:
+            logger.warning("⚠️ Expected services to be a list for project %s, got %s", project_name, type(project_services))
+            continue
             
-            project_services = project.get("services", [])
-            if not isinstance(project_services, list):
-                print(f"⚠️ Expected services to be a list for project {project_name}, got {type(project_services)}")
+        for service in project_services:
+            if type(service) is not dict:
+                logger.warning("⚠️ Expected service to be a dict, got %s: %s", type(service), service)
                 continue
                 
-            for service in project_services:
-                if not isinstance(service, dict):
-                    print(f"⚠️ Expected service to be a dict, got {type(service)}: {service}")
-                    continue
-                    
-                service_name = service.get("name", "")
-                if not service_name:
-                    print(f"⚠️ Service missing name field in project {project_name}: {service}")
-                    continue
-                    
-                services.append({
-                    "project": project_name,
-                    "service": service_name,
-                    "full_name": f"{project_name}_{service_name}"
-                })
+            try:
+                service_name = service["name"]
+            except KeyError:
+                service_name = None
+            if not service_name:
+                logger.warning("⚠️ Service missing name field in project %s: %s", project_name, service)
+                continue
                 
-    except Exception as e:
-        print(f"❌ Error parsing projects and services: {e}")
-        import traceback
-        print(f"Full traceback: {traceback.format_exc()}")
-    
+            yield Service(project_name, service_name)
+
+def parse_canonical(response):
+    """Fast path for the usual response shape, or None for any other shape
+
+    Expects result.data.json to be a list of named projects, each with a
+    list of named services. Everything else goes through iter_services(),
+    which knows the other shapes and reports malformed entries.
+    """
+    try:
+        services = [
+            Service(project["name"], service["name"])
+            for project in response["result"]["data"]["json"]
+            for service in project["services"]
+        ]
+    except (KeyError, TypeError):
+        return None
+    if not all(project and service for project, service in services):
+        return None
     return services
 
-if __name__ == "__main__":
-    print("🔍 Testing API Response Parsing Logic")
-    print("=" * 50)
-    test_projects_parsing()
-    print("\n✅ All tests completed!")
+@functools.lru_cache(maxsize=8)
+def parse_projects_body(body):
+    """Parse a raw response body, reusing the result when the body is unchanged"""
+    return tuple(parse_projects_response(json_loads(body)))
+
+def parse_projects_response(response):
+    """Simulate the parsing logic from autoscaler.py
+
+    Tries parse_canonical() first, then collects iter_services().
+    """
+    if isinstance(response, (bytes, bytearray)):
+        try:
+            return list(parse_projects_body(bytes(response)))
+        except ValueError as e:  # Both JSONDecodeError flavours subclass it
+            logger.error("❌ Invalid JSON in projects response: %s", e)
+            return []
+
+    canonical = parse_canonical(response)
+    if canonical is not None:
+        return canonical
+
+    return list(iter_services(response))
+